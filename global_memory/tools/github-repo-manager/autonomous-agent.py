@@ -5,21 +5,56 @@ Monitors and manages claude-code-wsl-setup repository automatically
 """
 
 import os
+import re
 import sys
+import stat
 import time
 import json
+import sqlite3
 import hashlib
 import logging
+import platform
+import threading
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Set
-from watchdog.observers import Observer
+from typing import Dict, List, Optional, Set, Tuple
+from watchdog.observers.polling import PollingObserver
 from watchdog.events import FileSystemEventHandler
 from workflow_engine import GitHubRepoManager
 
+# Change detection only needs a fast digest, not a cryptographic one
+try:
+    from blake3 import blake3 as content_hasher
+    HASHER_NAME = 'blake3'
+except ImportError:
+    try:
+        from xxhash import xxh3_64 as content_hasher
+        HASHER_NAME = 'xxh3_64'
+    except ImportError:
+        content_hasher = hashlib.md5
+        HASHER_NAME = 'md5'
+
 class RepositoryMonitor(FileSystemEventHandler):
     """Monitors repository for changes and triggers automated workflows"""
     
+    HASH_CHUNK_SIZE = 64 * 1024  # Bytes read per update() when hashing
+    LARGE_FILE_THRESHOLD = 1 << 20  # Files at least this large use LARGE_CHUNK_SIZE
+    LARGE_CHUNK_SIZE = 1 << 20  # Bytes read per update() for large files
+    MAX_HASH_WORKERS = 8  # Cap concurrent hashing to avoid thrashing the disk queue
+    MERGE_MAX_FILES = 10  # Mixed-category change sets below this become one PR
+    _EXT_CATEGORY = {
+        '.md': 'docs',
+        '.yaml': 'config',
+        '.yml': 'config',
+        '.json': 'config',
+        '.ini': 'config',
+        '.sh': 'feature',
+        '.py': 'feature'
+    }
+    # Most specific first; a merged batch takes the first category present
+    _CATEGORY_PRIORITY = ('feature', 'fix', 'config', 'docs')
+    
     def __init__(self, repo_path: str, manager: GitHubRepoManager):
         self.repo_path = Path(repo_path)
         self.manager = manager
@@ -31,71 +66,236 @@ class RepositoryMonitor(FileSystemEventHandler):
         }
         self.last_process_time = 0
         self.process_delay = 30  # Wait 30 seconds before processing
+        self.debounce_delay = 0.2  # Quiet period before a path is hashed
+        # Files above this size are almost always build artifacts or binaries
+        monitoring = manager.config.get('monitoring', {})
+        self.max_tracked_size = monitoring.get('max_tracked_size', 5 * 1024 * 1024)
+        self.reconcile_interval = 60  # Full rescan to catch events the observer dropped
+        self._last_reconcile = 0.0
+        self._scan_fingerprints: Optional[Dict[str, str]] = None
+        self._dirty: Dict[str, float] = {}
+        self._dirty_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._ignore_re = re.compile(
+            # Unanchored, like plain substring checks: also covers prod.env,
+            # .env/ virtualenvs, .tmp/ dirs and rotated logs such as app.log.1.gz
+            r'\.git/|__pycache__/|\.pyc|\.log|\.tmp|\.swp|\.DS_Store|node_modules/|\.env'
+        )
         self.file_hashes = {}
+        self._changed_hashes: Dict[str, str] = {}
+        self._repo_str = str(self.repo_path) + os.sep
+        self._path_meta: Dict[str, Tuple[str, str]] = {}
+        self.hash_db = Path("/home/jb_remus/claude_global_memory/tools/github-repo-manager/.file_hashes.db")
+        self._db = None
         self._load_file_hashes()
         
     def _load_file_hashes(self):
         """Load existing file hashes to detect actual changes"""
-        hash_file = Path("/home/jb_remus/claude_global_memory/tools/github-repo-manager/.file_hashes.json")
-        if hash_file.exists():
-            with open(hash_file, 'r') as f:
+        self._db = sqlite3.connect(str(self.hash_db))
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS file_hashes (path TEXT PRIMARY KEY, hash TEXT)')
+        self.file_hashes = dict(self._db.execute('SELECT path, hash FROM file_hashes'))
+        
+        # Carry over the cache from the JSON file used by earlier versions
+        legacy_file = self.hash_db.with_suffix('.json')
+        if not self.file_hashes and legacy_file.exists():
+            with open(legacy_file, 'r') as f:
                 self.file_hashes = json.load(f)
-                
+            self._changed_hashes = dict(self.file_hashes)
+            self._save_file_hashes()
+            
     def _save_file_hashes(self):
         """Save file hashes for change detection"""
-        hash_file = Path("/home/jb_remus/claude_global_memory/tools/github-repo-manager/.file_hashes.json")
-        with open(hash_file, 'w') as f:
-            json.dump(self.file_hashes, f, indent=2)
-            
-    def _get_file_hash(self, filepath: Path) -> str:
+        if not self._changed_hashes:
+            return
+        # Commits on success, rolls back if the write fails
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO file_hashes VALUES (?, ?)',
+                                 self._changed_hashes.items())
+        self._changed_hashes.clear()
+        
+    def _stat_file(self, filepath: str) -> Optional[os.stat_result]:
+        """Stat a path once, returning None unless it is a regular file"""
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        return st
+        
+    def _get_file_fingerprint(self, st: os.stat_result) -> str:
+        """Calculate a cheap size+mtime fingerprint for change detection"""
+        return f"{st.st_size}:{st.st_mtime_ns}"
+        
+    def _get_file_hash(self, filepath: str) -> Optional[str]:
         """Calculate file hash for change detection"""
-        if not filepath.exists() or not filepath.is_file():
+        st = self._stat_file(filepath)
+        if st is None:
+            return ""  # Missing or not a regular file
+        if st.st_size > self.max_tracked_size:
+            return None  # Too large to track at all
+        # Entries are "<size>:<mtime_ns>:<hasher>-<digest>"
+        fingerprint = self._get_file_fingerprint(st)
+        cached = self.file_hashes.get(filepath, "")
+        if cached.rpartition(':')[0] == fingerprint:
+            return cached
+        digest = content_hasher()
+        # readinto() reuses one buffer, and unlike mmap it survives truncation mid-hash
+        large = st.st_size >= self.LARGE_FILE_THRESHOLD
+        buffer = bytearray(self.LARGE_CHUNK_SIZE if large else self.HASH_CHUNK_SIZE)
+        view = memoryview(buffer)
+        try:
+            with open(filepath, 'rb', buffering=0) as f:
+                while True:
+                    size = f.readinto(buffer)
+                    if not size:
+                        break
+                    digest.update(view[:size])
+        except OSError:
+            # Removed or replaced between the stat and the read
             return ""
-        with open(filepath, 'rb') as f:
-            return hashlib.md5(f.read()).hexdigest()
+        return f"{fingerprint}:{HASHER_NAME}-{digest.hexdigest()}"
             
-    def _categorize_file(self, filepath: Path) -> str:
-        """Categorize file to determine update type"""
-        rel_path = filepath.relative_to(self.repo_path)
-        path_str = str(rel_path).lower()
+    def _get_path_meta(self, abs_path: str) -> Tuple[str, str]:
+        """Return (rel_path, category) for a path, computed once per path"""
+        meta = self._path_meta.get(abs_path)
+        if meta is None:
+            if abs_path.startswith(self._repo_str):
+                rel_path = abs_path[len(self._repo_str):]
+            else:
+                rel_path = os.path.relpath(abs_path, self._repo_str)
+            meta = (rel_path, self._categorize_file(rel_path))
+            self._path_meta[abs_path] = meta
+        return meta
         
-        if any(doc in path_str for doc in ['readme', 'doc', '.md', 'license']):
+    def _categorize_file(self, rel_path: str) -> str:
+        """Categorize file to determine update type"""
+        category = self._EXT_CATEGORY.get(os.path.splitext(rel_path)[1].lower())
+        if category:
+            return category
+            
+        name = os.path.basename(rel_path).lower()
+        if name.startswith('readme') or name.startswith('license'):
             return 'docs'
-        elif any(cfg in path_str for cfg in ['config', '.yaml', '.yml', '.json', '.ini']):
-            return 'config'
-        elif any(script in path_str for script in ['.sh', '.py', 'script']):
-            return 'feature'
-        else:
-            return 'feature'
+        return 'feature'
             
-    def _should_ignore_file(self, filepath: Path) -> bool:
+    def _should_ignore_file(self, filepath: str) -> bool:
         """Check if file should be ignored"""
-        ignore_patterns = [
-            '.git/', '__pycache__/', '.pyc', '.log', '.tmp',
-            '.swp', '.DS_Store', 'node_modules/', '.env'
-        ]
-        path_str = str(filepath)
-        return any(pattern in path_str for pattern in ignore_patterns)
+        return bool(self._ignore_re.search(filepath))
         
     def on_modified(self, event):
         """Handle file modification events"""
         if event.is_directory:
             return
             
-        filepath = Path(event.src_path)
-        
         # Ignore certain files
-        if self._should_ignore_file(filepath):
+        if self._should_ignore_file(event.src_path):
             return
             
-        # Check if file actually changed
-        new_hash = self._get_file_hash(filepath)
-        old_hash = self.file_hashes.get(str(filepath), "")
+        # Observer thread: only record the path, hashing waits for debounce_delay
+        with self._dirty_lock:
+            self._dirty[event.src_path] = time.monotonic()
+        self._wake.set()
+        
+    def _seconds_until_due(self) -> float:
+        """Seconds until dirty paths settle, queued changes are due, or a rescan is"""
+        now = time.monotonic()
+        waits = [self._last_reconcile + self.reconcile_interval - now]
+        with self._dirty_lock:
+            if self._dirty:
+                waits.append(min(self._dirty.values()) + self.debounce_delay - now)
+        if any(self.pending_changes.values()):
+            waits.append(self.last_process_time + self.process_delay - time.time())
+        return max(0.0, min(waits))
+        
+    def wait_for_changes(self):
+        """Block until a watchdog event arrives or queued work falls due"""
+        if self._wake.wait(timeout=self._seconds_until_due()):
+            self._wake.clear()
+            
+    def _collect_settled_paths(self) -> List[str]:
+        """Pop dirty paths that have not seen an event within debounce_delay"""
+        now = time.monotonic()
+        with self._dirty_lock:
+            settled = [path for path, seen in self._dirty.items()
+                       if now - seen >= self.debounce_delay]
+            for path in settled:
+                del self._dirty[path]
+        return settled
+        
+    def reconcile(self):
+        """Rescan the repository and mark paths whose fingerprint moved as dirty"""
+        fingerprints = {}
+        for root, dirs, files in os.walk(self.repo_path):
+            dirs[:] = [d for d in dirs
+                       if not self._should_ignore_file(os.path.join(root, d) + os.sep)]
+            for name in files:
+                path = os.path.join(root, name)
+                if self._should_ignore_file(path):
+                    continue
+                st = self._stat_file(path)
+                if st is not None and st.st_size <= self.max_tracked_size:
+                    fingerprints[path] = self._get_file_fingerprint(st)
+                    
+        previous = self._scan_fingerprints
+        self._scan_fingerprints = fingerprints
+        self._last_reconcile = time.monotonic()
+        # The first walk only records a baseline
+        if previous is None:
+            return
+            
+        missed = [path for path, fingerprint in fingerprints.items()
+                  if previous.get(path) != fingerprint]
+        if missed:
+            logging.info(f"Reconciliation scan found {len(missed)} changed file(s)")
+            # Backdate so the paths are treated as already settled
+            settled_time = self._last_reconcile - self.debounce_delay
+            with self._dirty_lock:
+                for path in missed:
+                    self._dirty.setdefault(path, settled_time)
+                    
+    def _detect_changes(self):
+        """Hash settled paths in parallel and queue the ones that changed"""
+        paths = self._collect_settled_paths()
+        if not paths:
+            return
+            
+        # hashlib releases the GIL while digesting, so threads overlap I/O and CPU
+        with ThreadPoolExecutor(max_workers=min(self.MAX_HASH_WORKERS, len(paths))) as executor:
+            hashes = list(executor.map(self._get_file_hash, paths))
+            
+        for filepath, new_hash in zip(paths, hashes):
+            if new_hash is not None:
+                self._check_file(filepath, new_hash)
+            
+    def _split_digest(self, entry: str) -> Tuple[str, str]:
+        """Split a cache entry into (hasher, digest)"""
+        digest = entry.rpartition(':')[2]
+        hasher, sep, value = digest.partition('-')
+        # Untagged digests predate the hasher tag and were always MD5
+        return (hasher, value) if sep else ('md5', digest)
+        
+    def _check_file(self, filepath: str, new_hash: str):
+        """Queue the file for processing if its contents actually changed"""
+        old_hash = self.file_hashes.get(filepath, "")
         
         if new_hash != old_hash:
-            self.file_hashes[str(filepath)] = new_hash
-            category = self._categorize_file(filepath)
-            rel_path = str(filepath.relative_to(self.repo_path))
+            self.file_hashes[filepath] = new_hash
+            self._changed_hashes[filepath] = new_hash
+            
+            old_hasher, old_digest = self._split_digest(old_hash)
+            new_hasher, new_digest = self._split_digest(new_hash)
+            
+            # A touch that leaves the contents intact only moves the fingerprint
+            if new_digest == old_digest:
+                return
+                
+            # Digests from another hasher can't be compared; re-baseline silently
+            if old_hash and new_hash and old_hasher != new_hasher:
+                return
+                
+            rel_path, category = self._get_path_meta(filepath)
             self.pending_changes[category].add(rel_path)
             logging.info(f"Change detected: {rel_path} (category: {category})")
             
@@ -106,44 +306,76 @@ class RepositoryMonitor(FileSystemEventHandler):
             
     def process_pending_changes(self):
         """Process accumulated changes"""
+        if time.monotonic() - self._last_reconcile >= self.reconcile_interval:
+            self.reconcile()
+            
+        self._detect_changes()
+        
         current_time = time.time()
         
         # Check if enough time has passed
         if current_time - self.last_process_time < self.process_delay:
             return
             
-        # Process each category of changes
-        for category, files in self.pending_changes.items():
-            if files:
-                self._process_category_changes(category, list(files))
-                files.clear()
+        # Git work is sequential on the one working tree; PRs are opened together
+        updates = []
+        for category, files, description in self._batch_pending_changes():
+            update = self._prepare_category_changes(category, files, description)
+            if update:
+                updates.append((category, update))
                 
+        if updates:
+            try:
+                results = self.manager.create_pull_requests([update for _, update in updates])
+            except Exception as e:
+                logging.error(f"Error creating pull requests: {str(e)}")
+                results = []
+            for (category, _), result in zip(updates, results):
+                if result['status'] == 'success':
+                    logging.info(f"Successfully processed {category} update: {result['pr_url']}")
+                else:
+                    logging.error(f"Failed to process {category} update")
+                    
         self.last_process_time = current_time
         self._save_file_hashes()
         
-    def _process_category_changes(self, category: str, files: List[str]):
-        """Process changes for a specific category"""
-        # Generate description
-        if len(files) == 1:
-            description = f"Update {files[0]}"
-        else:
-            description = f"Update {len(files)} {category} files"
+    def _batch_pending_changes(self) -> List[Tuple[str, List[str], str]]:
+        """Drain pending changes into (category, files, description) batches"""
+        pending = {category: sorted(files)
+                   for category, files in self.pending_changes.items() if files}
+        for files in self.pending_changes.values():
+            files.clear()
+            
+        total = sum(len(files) for files in pending.values())
+        # Small mixed-category sets become one PR under the most specific category
+        if len(pending) >= 2 and total < self.MERGE_MAX_FILES:
+            category = min(pending, key=self._CATEGORY_PRIORITY.index)
+            files = [f for category_files in pending.values() for f in category_files]
+            return [(category, files, f"Update {total} files")]
             
+        batches = []
+        for category, files in pending.items():
+            if len(files) == 1:
+                description = f"Update {files[0]}"
+            else:
+                description = f"Update {len(files)} {category} files"
+            batches.append((category, files, description))
+        return batches
+        
+    def _prepare_category_changes(self, category: str, files: List[str],
+                                  description: str) -> Optional[Dict]:
+        """Branch, commit and push changes for a specific category"""
         try:
             # Initialize repository if needed
             if not hasattr(self.manager, 'repo_path') or not self.manager.repo_path:
                 self.manager.initialize_repository(str(self.repo_path))
                 
-            # Process the update
-            result = self.manager.process_update(category, files, description)
+            # Prepare the update; the pull request is opened by the caller
+            return self.manager.prepare_update(category, files, description)
             
-            if result['status'] == 'success':
-                logging.info(f"Successfully processed {category} update: {result['pr_url']}")
-            else:
-                logging.error(f"Failed to process {category} update")
-                
         except Exception as e:
             logging.error(f"Error processing {category} changes: {str(e)}")
+            return None
 
 
 class AutonomousAgent:
@@ -189,7 +421,13 @@ class AutonomousAgent:
         
         # Set up file monitoring
         self.monitor = RepositoryMonitor(self.repo_path, self.manager)
-        self.observer = Observer()
+        # Pick the backend explicitly: native inotify on Linux, polling where
+        # change notifications are unreliable (Windows shares, CIFS mounts)
+        if platform.system() == 'Linux':
+            from watchdog.observers.inotify import InotifyObserver
+            self.observer = InotifyObserver()
+        else:
+            self.observer = PollingObserver(timeout=1.0)
         self.observer.schedule(self.monitor, self.repo_path, recursive=True)
         
     def _install_git_hooks(self):
@@ -218,12 +456,12 @@ class AutonomousAgent:
         
         try:
             while True:
+                # Sleep until an event arrives or queued work is due
+                self.monitor.wait_for_changes()
+                
                 # Process pending changes
                 self.monitor.process_pending_changes()
                 
-                # Sleep for a short interval
-                time.sleep(5)
-                
         except KeyboardInterrupt:
             self.logger.info("Shutting down agent...")
             self.observer.stop()
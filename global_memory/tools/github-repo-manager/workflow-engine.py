@@ -6,29 +6,70 @@ CRITICAL: Always uses branches, NEVER commits to main
 """
 
 import os
+import re
 import sys
 import yaml
+import shutil
+import requests
 import subprocess
 import datetime
+import functools
 import logging
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
+try:
+    import pygit2
+except ImportError:
+    pygit2 = None
+
 class GitHubRepoManager:
     """Automated GitHub repository management with branch-based workflow"""
     
+    GIT_ADD_BATCH_SIZE = 4096  # Pathspecs per git add, keeps argv under OS limits
+    MAX_PR_WORKERS = 4  # Pull requests created concurrently per batch
+    GITHUB_API_URL = "https://api.github.com"
+    _gh_available: Optional[bool] = None  # Resolved once per process
+    
+    # One scan per file; the anchored lookaheads keep docs > config > scripts
+    # priority for names that would match more than one scope
+    _SCOPE_RE = re.compile(
+        r'^(?:(?=.*doc)()'
+        r'|(?=.*(?:config|\.ya?ml$|\.json$))()'
+        r'|(?=.*(?:script|\.sh$|\.py$))())',
+        re.IGNORECASE
+    )
+    _SCOPES = ('docs', 'config', 'scripts')
+    
+    # Parsed configs keyed by path, reused while the file's mtime is unchanged
+    _CONFIG_CACHE: Dict[Path, Tuple[int, Dict]] = {}
+    
     def __init__(self, config_path: str = "agent-config.yaml"):
         self.config = self._load_config(config_path)
+        self._protected_set = frozenset(self.config['branch_protection']['protected_branches'])
         self.repo_path = None
         self.current_branch = None
+        self._repo = None
+        self._api_session = None
         self._setup_logging()
         self._validate_configuration()
         
     def _load_config(self, config_path: str) -> Dict:
         """Load agent configuration from YAML file"""
         config_file = Path(__file__).parent / config_path
+        mtime = config_file.stat().st_mtime_ns
+        cached = self._CONFIG_CACHE.get(config_file)
+        if cached and cached[0] == mtime:
+            return cached[1]
+            
+        # Prefer the libyaml-backed loader when PyYAML was built with it
+        loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
         with open(config_file, 'r') as f:
-            return yaml.safe_load(f)
+            config = yaml.load(f, Loader=loader)
+        self._CONFIG_CACHE[config_file] = (mtime, config)
+        return config
             
     def _setup_logging(self):
         """Configure logging for the agent"""
@@ -66,9 +107,18 @@ class GitHubRepoManager:
             self.logger.error(f"Git command failed: {' '.join(command)}")
             return e.returncode, e.stdout, e.stderr
             
+    def _get_repository(self):
+        """Return a persistent libgit2 handle, or None without pygit2"""
+        if pygit2 is None or not self.repo_path:
+            return None
+        if self._repo is None:
+            self._repo = pygit2.Repository(str(self.repo_path))
+        return self._repo
+        
     def initialize_repository(self, repo_path: str):
         """Initialize or clone the repository"""
         self.repo_path = Path(repo_path)
+        self._repo = None
         
         if not self.repo_path.exists():
             self.logger.info(f"Cloning repository to {repo_path}")
@@ -85,8 +135,7 @@ class GitHubRepoManager:
         _, current_branch, _ = self._run_git_command(['branch', '--show-current'])
         current_branch = current_branch.strip()
         
-        protected_branches = self.config['branch_protection']['protected_branches']
-        if current_branch in protected_branches:
+        if current_branch in self._protected_set:
             # Switch to a safe working branch
             safe_branch = f"work/{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}"
             self.logger.warning(f"On protected branch '{current_branch}', switching to '{safe_branch}'")
@@ -123,9 +172,36 @@ class GitHubRepoManager:
         # Verify we're not on main
         self._ensure_not_on_main()
         
-        # Stage files
-        for file in files:
-            self._run_git_command(['add', file])
+        # Stage files in-process through libgit2 when available. The commit
+        # itself still goes through git so the installed hooks run.
+        repo = self._get_repository()
+        if repo is not None:
+            index = repo.index
+            index.read()
+            for file in files:
+                # libgit2 only takes repo-relative paths
+                path = os.path.relpath(file, self.repo_path) if os.path.isabs(file) else file
+                tracked = path in index
+                if (self.repo_path / path).exists():
+                    # Index.add bypasses .gitignore, unlike git add
+                    if repo.path_is_ignored(path) and not tracked:
+                        self.logger.warning(f"Skipping ignored file: {path}")
+                        continue
+                    index.add(path)
+                elif tracked:
+                    index.remove(path)
+                else:
+                    self.logger.error(f"Cannot stage missing untracked file: {path}")
+            index.write()
+        else:
+            # One git add per batch of pathspecs rather than one per file
+            pending = iter(files)
+            for batch in iter(lambda: list(islice(pending, self.GIT_ADD_BATCH_SIZE)), []):
+                returncode, _, _ = self._run_git_command(['add', '--'] + batch, check=False)
+                if returncode != 0:
+                    # One stale pathspec fails the whole batch; stage what still can be
+                    for file in batch:
+                        self._run_git_command(['add', '--', file])
             
         # Format commit message
         commit_format = self.config['workflow_rules']['commit_conventions']['format']
@@ -144,8 +220,7 @@ class GitHubRepoManager:
             raise ValueError("No current branch set")
             
         # CRITICAL: Verify we're not pushing to main
-        protected = self.config['branch_protection']['protected_branches']
-        if self.current_branch in protected:
+        if self.current_branch in self._protected_set:
             raise ValueError(f"BLOCKED: Cannot push to protected branch '{self.current_branch}'")
             
         push_cmd = ['push']
@@ -157,12 +232,34 @@ class GitHubRepoManager:
         self.logger.info(f"Pushing branch: {self.current_branch}")
         self._run_git_command(push_cmd)
         
-    def create_pull_request(self, title: str, body: str, labels: List[str] = None):
-        """Create a pull request using GitHub CLI"""
+    def _get_api_session(self) -> Optional[requests.Session]:
+        """Return a keep-alive GitHub API session, or None when no token is set"""
+        if self._api_session is None:
+            token = os.environ.get('GH_TOKEN') or os.environ.get('GITHUB_TOKEN')
+            if not token:
+                return None
+            session = requests.Session()
+            session.headers.update({
+                'Authorization': f"Bearer {token}",
+                'Accept': 'application/vnd.github+json'
+            })
+            self._api_session = session
+        return self._api_session
+        
+    def create_pull_request(self, title: str, body: str, labels: List[str] = None,
+                            head: Optional[str] = None):
+        """Create a pull request via the GitHub API, falling back to GitHub CLI"""
+        head = head or self.current_branch
+        draft = self.config['workflow_rules']['pull_request']['draft_by_default']
+        
+        session = self._get_api_session()
+        if session is not None:
+            return self._create_pull_request_via_api(session, title, body, labels, head, draft)
+            
         # Ensure gh CLI is available
-        try:
-            subprocess.run(['gh', '--version'], capture_output=True, check=True)
-        except (subprocess.CalledProcessError, FileNotFoundError):
+        if type(self)._gh_available is None:
+            type(self)._gh_available = shutil.which('gh') is not None
+        if not self._gh_available:
             self.logger.error("GitHub CLI (gh) not found. Please install it.")
             return None
             
@@ -170,13 +267,14 @@ class GitHubRepoManager:
             'gh', 'pr', 'create',
             '--title', title,
             '--body', body,
-            '--base', self.config['repository']['default_branch']
+            '--base', self.config['repository']['default_branch'],
+            '--head', head
         ]
         
         if labels:
             pr_cmd.extend(['--label', ','.join(labels)])
             
-        if self.config['workflow_rules']['pull_request']['draft_by_default']:
+        if draft:
             pr_cmd.append('--draft')
             
         self.logger.info(f"Creating pull request: {title}")
@@ -190,8 +288,43 @@ class GitHubRepoManager:
             self.logger.error(f"Failed to create PR: {result.stderr}")
             return None
             
-    def process_update(self, update_type: str, files: List[str], description: str):
-        """Process an update through the complete workflow"""
+    def _create_pull_request_via_api(self, session: requests.Session, title: str, body: str,
+                                     labels: Optional[List[str]], head: str, draft: bool):
+        """Create a pull request with the GitHub REST API"""
+        repo = self.config['repository']
+        repo_url = f"{self.GITHUB_API_URL}/repos/{repo['owner']}/{repo['name']}"
+        
+        self.logger.info(f"Creating pull request: {title}")
+        try:
+            response = session.post(f"{repo_url}/pulls", json={
+                'title': title,
+                'body': body,
+                'head': head,
+                'base': repo['default_branch'],
+                'draft': draft
+            }, timeout=30)
+            if response.status_code != 201:
+                self.logger.error(f"Failed to create PR: {response.status_code} {response.text}")
+                return None
+            pr = response.json()
+            
+            # Pull requests share the issue number space for labels
+            if labels:
+                label_response = session.post(f"{repo_url}/issues/{pr['number']}/labels",
+                                              json={'labels': labels}, timeout=30)
+                if label_response.status_code != 200:
+                    self.logger.error(f"Failed to label PR #{pr['number']}: "
+                                      f"{label_response.status_code} {label_response.text}")
+        except requests.RequestException as e:
+            self.logger.error(f"Failed to create PR: {str(e)}")
+            return None
+            
+        pr_url = pr['html_url']
+        self.logger.info(f"Pull request created: {pr_url}")
+        return pr_url
+        
+    def prepare_update(self, update_type: str, files: List[str], description: str) -> Dict:
+        """Branch, commit and push an update, returning the pull request to open"""
         self.logger.info(f"Processing {update_type} update: {description}")
         
         # Create appropriate branch
@@ -216,30 +349,61 @@ class GitHubRepoManager:
         # Push branch
         self.push_branch()
         
-        # Create pull request
-        pr_title = f"{commit_type}({scope}): {description}"
-        pr_body = self._generate_pr_body(update_type, files, description)
-        labels = [branch_type, 'automated']
-        
-        pr_url = self.create_pull_request(pr_title, pr_body, labels)
-        
         return {
             'branch': branch_name,
             'commit_type': commit_type,
+            'title': f"{commit_type}({scope}): {description}",
+            'body': self._generate_pr_body(update_type, files, description),
+            'labels': [branch_type, 'automated']
+        }
+        
+    def _finish_update(self, update: Dict) -> Dict:
+        """Open the pull request for a prepared update"""
+        pr_url = self.create_pull_request(update['title'], update['body'],
+                                          update['labels'], head=update['branch'])
+        return {
+            'branch': update['branch'],
+            'commit_type': update['commit_type'],
             'pr_url': pr_url,
             'status': 'success' if pr_url else 'failed'
         }
         
+    def _finish_update_safely(self, update: Dict) -> Dict:
+        """Open the pull request for a prepared update, never raising"""
+        try:
+            return self._finish_update(update)
+        except Exception as e:
+            self.logger.error(f"Error creating pull request for {update['branch']}: {str(e)}")
+            return {
+                'branch': update['branch'],
+                'commit_type': update['commit_type'],
+                'pr_url': None,
+                'status': 'failed'
+            }
+            
+    def process_update(self, update_type: str, files: List[str], description: str):
+        """Process an update through the complete workflow"""
+        return self._finish_update(self.prepare_update(update_type, files, description))
+        
+    def create_pull_requests(self, updates: List[Dict]) -> List[Dict]:
+        """Open pull requests for several prepared updates concurrently"""
+        if not updates:
+            return []
+        # Git work above is sequential; PRs only reference pushed branches
+        with ThreadPoolExecutor(max_workers=min(self.MAX_PR_WORKERS, len(updates))) as executor:
+            return list(executor.map(self._finish_update_safely, updates))
+            
     def _determine_scope(self, files: List[str]) -> str:
         """Determine commit scope based on affected files"""
-        if any('doc' in f.lower() for f in files):
-            return 'docs'
-        elif any('config' in f.lower() or '.yaml' in f or '.json' in f for f in files):
-            return 'config'
-        elif any('script' in f.lower() or '.sh' in f or '.py' in f for f in files):
-            return 'scripts'
-        else:
-            return 'core'
+        counts = [0] * len(self._SCOPES)
+        for f in files:
+            match = self._SCOPE_RE.match(f)
+            if match:
+                counts[match.lastindex - 1] += 1
+                
+        # Most files wins; ties go to the earlier scope
+        best = max(range(len(counts)), key=lambda i: (counts[i], -i))
+        return self._SCOPES[best] if counts[best] else 'core'
             
     def _generate_pr_body(self, update_type: str, files: List[str], description: str) -> str:
         """Generate pull request body"""
@@ -270,10 +434,12 @@ class GitHubRepoManager:
 
 
 # Standalone functions for common operations
-def setup_agent():
+# Cached so repeated calls share one initialized manager
+@functools.lru_cache(maxsize=1)
+def setup_agent(config_path: str = "agent-config.yaml",
+                repo_path: str = "/home/jb_remus/repos/claude-code-wsl-setup"):
     """Initial setup of the repository management agent"""
-    manager = GitHubRepoManager()
-    repo_path = "/home/jb_remus/repos/claude-code-wsl-setup"
+    manager = GitHubRepoManager(config_path)
     manager.initialize_repository(repo_path)
     return manager
     